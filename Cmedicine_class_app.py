@@ -10,9 +10,12 @@ import streamlit as st
 import pandas as pd
 import random
 import os
-import io
 import base64
 import datetime as dt
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from image_tools import LRUCache, card_png, combo_png, render_batch
 
 try:
     from PIL import Image, ImageDraw
@@ -35,8 +38,10 @@ FIXED_SIZE = 300
 DEFAULT_MODE = "模式1：隨機10題多回合"
 
 TILE_SIZE = 200
-TMP_DIR = os.path.join(os.getcwd(), "temp_images")
-os.makedirs(TMP_DIR, exist_ok=True)
+
+# 圖片平行渲染：整台伺服器共用一個行程池，上限 IMAGE_WORKERS 個行程
+IMAGE_WORKERS = max(1, min(4, os.cpu_count() or 1))
+IMAGE_CACHE_MAX_ENTRIES = 300
 
 # GSheet config
 SPREADSHEET_NAME = "streamlit-cmedicine-app"
@@ -90,37 +95,66 @@ def load_question_bank():
 
 
 # ================= 圖片工具 =================
-def crop_square_bottom(img, size=300):
-    w, h = img.size
-    if h > w:
-        img = img.crop((0, h - w, w, h))
-    elif w > h:
-        left = (w - h) // 2
-        img = img.crop((left, 0, left + h, h))
-    return img.resize((size, size))
+@st.cache_resource
+def _get_image_pool():
+    """
+    伺服器共用的行程池；無法建立時回傳 None（改為逐張渲染）。
+    伺服器本身是多執行緒，不可用 fork 建立子行程，改用 forkserver / spawn。
+    """
+    method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    try:
+        return ProcessPoolExecutor(max_workers=IMAGE_WORKERS,
+                                   mp_context=multiprocessing.get_context(method))
+    except Exception:
+        return None
+
+
+@st.cache_resource
+def _get_image_cache():
+    """已渲染圖片的 PNG bytes（LRU），key 含檔案修改時間，圖片更新後自動失效。"""
+    return LRUCache(IMAGE_CACHE_MAX_ENTRIES)
+
+
+def _file_stamp(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
 
+def render_images_parallel(tasks):
+    """tasks: [(key, func, args), ...]；依序回傳 PNG bytes，行程池損壞時丟棄並於下次重建。"""
+    pool = _get_image_pool() if len(tasks) > 1 else None
+    return render_batch(tasks, _get_image_cache(), pool, on_pool_broken=_get_image_pool.clear)
+
+
+def prerender_cards(paths, size=300):
+    """一次平行渲染整頁圖卡，回傳與 paths 同順序的 PNG bytes（失敗為 None）。"""
+    if Image is None:
+        return [None] * len(paths)
+    tasks = [(("card", p, size, _file_stamp(p)), card_png, (p, size)) for p in paths]
+    return render_images_parallel(tasks)
 
-def render_img_card(path, size=300, border_color=None):
+
+def render_img_card(path, size=300, border_color=None, png=None):
     if not os.path.isfile(path):
         st.warning(f"⚠ 找不到圖片：{path}")
         return
     if Image is None:
         st.image(path, width=size)
         return
-    try:
-        img = Image.open(path)
-        img = crop_square_bottom(img, size)
-        buf = io.BytesIO()
-        img.save(buf, format="PNG")
-        b64 = base64.b64encode(buf.getvalue()).decode("utf-8")
-        border_css = f"border:4px solid {border_color};" if border_color else "border:4px solid transparent;"
-        st.markdown(
-            f"<div class='img-card' style='{border_css}'>"
-            f"<img src='data:image/png;base64,{b64}' width='{size}'></div>",
-            unsafe_allow_html=True
-        )
-    except Exception:
+    if png is None:
+        png = prerender_cards([path], size)[0]
+    if png is None:
         st.image(path, width=size)
+        return
+    b64 = base64.b64encode(png).decode("utf-8")
+    border_css = f"border:4px solid {border_color};" if border_color else "border:4px solid transparent;"
+    st.markdown(
+        f"<div class='img-card' style='{border_css}'>"
+        f"<img src='data:image/png;base64,{b64}' width='{size}'></div>",
+        unsafe_allow_html=True
+    )
 
 
 # ================= GSheet 連線與寫入 =================
@@ -250,11 +284,13 @@ def run_mode1(bank):
     score_this = 0
     wrong_this_round = []
 
+    img_paths = [os.path.join(IMAGE_DIR, bank[idx]["filename"]) for idx in current_idxs]
+    img_pngs = prerender_cards(img_paths, FIXED_SIZE)
+
     for local_i, idx in enumerate(current_idxs):
         q = bank[idx]
         st.markdown(f"**Q{local_i+1}. 這個中藥的名稱是？**")
-        img_path = os.path.join(IMAGE_DIR, q["filename"])
-        render_img_card(img_path, size=FIXED_SIZE)
+        render_img_card(img_paths[local_i], size=FIXED_SIZE, png=img_pngs[local_i])
 
         opt_key = f"m1_r{current_round}_q{local_i}"
         opts = get_fixed_options(opt_key, q["name"], all_names, k=4)
@@ -332,8 +368,10 @@ def run_mode1(bank):
 
         if st.session_state.m1_wrong_log:
             st.markdown("#### ❌ 錯題總整理")
-            for miss in st.session_state.m1_wrong_log:
-                render_img_card(os.path.join(IMAGE_DIR, miss["filename"]), size=140)
+            miss_paths = [os.path.join(IMAGE_DIR, miss["filename"]) for miss in st.session_state.m1_wrong_log]
+            miss_pngs = prerender_cards(miss_paths, 140)
+            for miss, miss_path, miss_png in zip(st.session_state.m1_wrong_log, miss_paths, miss_pngs):
+                render_img_card(miss_path, size=140, png=miss_png)
                 st.markdown(
                     f"- 回合：第 {miss['round']} 回合  \n"
                     f"- 正解：**{miss['name']}**  \n"
@@ -371,6 +409,8 @@ def run_mode2(bank, filename_to_name):
     total_n = min(len(bank), 100)
     if "m2_round" not in st.session_state:
         init_mode2_state(total_n)
+    if "m2_pairs" not in st.session_state:
+        st.session_state.m2_pairs = {}
 
     current_round = st.session_state.m2_round
     current_idxs = st.session_state.m2_current_idxs
@@ -381,53 +421,25 @@ def run_mode2(bank, filename_to_name):
     GAP = 8
     COMBO_W = TILE_SIZE * 2 + GAP
 
-    def make_square_tile(path):
-        if os.path.exists(path) and Image is not None:
-            try:
-                return crop_square_bottom(Image.open(path), TILE_SIZE)
-            except Exception:
-                pass
-        if Image is None:
-            return None
-        return Image.new("RGB", (TILE_SIZE, TILE_SIZE), (240, 240, 240))
-
-    def compose_combo(left_tile, right_tile, hl_left=None, hl_right=None):
-        if Image is None:
-            return None
-        combo = Image.new("RGB", (COMBO_W, TILE_SIZE), "white")
-        if left_tile is not None:
-            combo.paste(left_tile, (0, 0))
-        if right_tile is not None:
-            combo.paste(right_tile, (TILE_SIZE + GAP, 0))
-        draw = ImageDraw.Draw(combo)
-
-        def draw_border(x, color):
-            draw.rectangle([x + 3, 3, x + TILE_SIZE - 4, TILE_SIZE - 4], outline=color, width=4)
-
-        if hl_left == "correct":
-            draw_border(0, (47, 158, 68))
-        elif hl_left == "wrong":
-            draw_border(0, (208, 0, 0))
-
-        if hl_right == "correct":
-            draw_border(TILE_SIZE + GAP, (47, 158, 68))
-        elif hl_right == "wrong":
-            draw_border(TILE_SIZE + GAP, (208, 0, 0))
-
-        return combo
-
     score_this = 0
     wrong_this_round = []
 
+    # 先決定每題左右圖與框線，整頁合成圖一次平行渲染
+    layouts = []
     for local_i, idx in enumerate(current_idxs):
         q = bank[idx]
-        st.markdown(f"**Q{local_i+1}. {q['name']}**")
 
-        # 一正一錯
-        all_idxs = list(range(total_n))
-        other_idxs = [i for i in all_idxs if i != idx]
-        wrong_idx = random.choice(other_idxs) if other_idxs else idx
-        left_is_correct = random.choice([True, False])
+        ans_key = f"m2_r{current_round}_q{local_i}"
+        chosen = st.session_state.get(ans_key)
+
+        # 一正一錯（每題固定，避免重新執行時左右圖跳動）
+        if ans_key not in st.session_state.m2_pairs:
+            all_idxs = list(range(total_n))
+            other_idxs = [i for i in all_idxs if i != idx]
+            wrong_idx = random.choice(other_idxs) if other_idxs else idx
+            left_is_correct = random.choice([True, False])
+            st.session_state.m2_pairs[ans_key] = (wrong_idx, left_is_correct)
+        wrong_idx, left_is_correct = st.session_state.m2_pairs[ans_key]
 
         left_idx = idx if left_is_correct else wrong_idx
         right_idx = wrong_idx if left_is_correct else idx
@@ -436,12 +448,6 @@ def run_mode2(bank, filename_to_name):
         right_file = bank[right_idx]["filename"]
         correct_file = q["filename"]
 
-        ans_key = f"m2_r{current_round}_q{local_i}"
-        chosen = st.session_state.get(ans_key)
-
-        left_tile = make_square_tile(os.path.join(IMAGE_DIR, left_file))
-        right_tile = make_square_tile(os.path.join(IMAGE_DIR, right_file))
-
         hl_left = hl_right = None
         if chosen is not None:
             if chosen == "left":
@@ -453,12 +459,27 @@ def run_mode2(bank, filename_to_name):
                 if right_file != correct_file and left_file == correct_file:
                     hl_left = "correct"
 
-        if Image is not None and ImageDraw is not None:
-            combo = compose_combo(left_tile, right_tile, hl_left, hl_right)
-            if combo is not None:
-                combo_path = os.path.join(TMP_DIR, f"m2_combo_r{current_round}_{local_i}.png")
-                combo.save(combo_path)
-                st.image(combo_path, width=COMBO_W)
+        layouts.append((left_file, right_file, correct_file, ans_key, chosen, hl_left, hl_right))
+
+    combo_pngs = [None] * len(layouts)
+    if Image is not None and ImageDraw is not None:
+        tasks = []
+        for left_file, right_file, _, _, _, hl_left, hl_right in layouts:
+            left_path = os.path.join(IMAGE_DIR, left_file)
+            right_path = os.path.join(IMAGE_DIR, right_file)
+            key = ("combo", left_path, _file_stamp(left_path), right_path, _file_stamp(right_path),
+                   TILE_SIZE, GAP, hl_left, hl_right)
+            tasks.append((key, combo_png, (left_path, right_path, TILE_SIZE, GAP, hl_left, hl_right)))
+        combo_pngs = render_images_parallel(tasks)
+
+    for local_i, idx in enumerate(current_idxs):
+        q = bank[idx]
+        st.markdown(f"**Q{local_i+1}. {q['name']}**")
+
+        left_file, right_file, correct_file, ans_key, chosen, _, _ = layouts[local_i]
+
+        if combo_pngs[local_i] is not None:
+            st.image(combo_pngs[local_i], width=COMBO_W)
         else:
             col_img1, col_img2 = st.columns(2)
             with col_img1:
@@ -548,8 +569,10 @@ def run_mode2(bank, filename_to_name):
 
         if st.session_state.m2_wrong_log:
             st.markdown("#### ❌ 錯題總整理")
-            for miss in st.session_state.m2_wrong_log:
-                render_img_card(os.path.join(IMAGE_DIR, miss["filename"]), size=140)
+            miss_paths = [os.path.join(IMAGE_DIR, miss["filename"]) for miss in st.session_state.m2_wrong_log]
+            miss_pngs = prerender_cards(miss_paths, 140)
+            for miss, miss_path, miss_png in zip(st.session_state.m2_wrong_log, miss_paths, miss_pngs):
+                render_img_card(miss_path, size=140, png=miss_png)
                 st.markdown(
                     f"- 回合：第 {miss['round']} 回合  \n"
                     f"- 題目：{miss['name']}  \n"
@@ -567,12 +590,15 @@ def run_fixed_range_mode(bank, start_idx, end_idx, mode_label):
     score = 0
     count = 0
 
-    for idx in range(start_idx, min(end_idx, len(bank))):
+    idxs = list(range(start_idx, min(end_idx, len(bank))))
+    img_paths = [os.path.join(IMAGE_DIR, bank[idx]["filename"]) for idx in idxs]
+    img_pngs = prerender_cards(img_paths, FIXED_SIZE)
+
+    for idx, img_path, img_png in zip(idxs, img_paths, img_pngs):
         q = bank[idx]
         count += 1
         st.markdown(f"**Q{idx+1}. 這個中藥的名稱是？**")
-        img_path = os.path.join(IMAGE_DIR, q["filename"])
-        render_img_card(img_path, size=FIXED_SIZE)
+        render_img_card(img_path, size=FIXED_SIZE, png=img_png)
 
         opt_key = f"fixed_{idx}"
         opts = get_fixed_options(opt_key, q["name"], all_names, k=4)
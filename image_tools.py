@@ -0,0 +1,184 @@
+# image_tools.py
+# 圖片裁切 / 合成工具（不依賴 streamlit，可在子行程中執行）
+#
+# 所有 *_png 函式皆回傳 PNG bytes，供 Cmedicine_class_app.py 以行程池平行呼叫。
+
+import io
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures.process import BrokenProcessPool
+
+try:
+    from PIL import Image, ImageDraw
+except ImportError:
+    Image = None
+    ImageDraw = None
+
+COLOR_CORRECT = (47, 158, 68)
+COLOR_WRONG = (208, 0, 0)
+
+
+def crop_square_bottom(img, size=300):
+    w, h = img.size
+    if h > w:
+        img = img.crop((0, h - w, w, h))
+    elif w > h:
+        left = (w - h) // 2
+        img = img.crop((left, 0, left + h, h))
+    return img.resize((size, size))
+
+
+def _to_png(img):
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def card_png(path, size=300):
+    """單張圖卡：裁成正方形後輸出 PNG；讀取失敗回傳 None（由呼叫端改用原圖）。"""
+    if Image is None:
+        return None
+    try:
+        with Image.open(path) as img:
+            return _to_png(crop_square_bottom(img, size))
+    except Exception:
+        return None
+
+
+def make_square_tile(path, tile_size):
+    if os.path.exists(path) and Image is not None:
+        try:
+            with Image.open(path) as img:
+                return crop_square_bottom(img, tile_size)
+        except Exception:
+            pass
+    if Image is None:
+        return None
+    return Image.new("RGB", (tile_size, tile_size), (240, 240, 240))
+
+
+def compose_combo(left_tile, right_tile, tile_size, gap, hl_left=None, hl_right=None):
+    if Image is None or ImageDraw is None:
+        return None
+    combo = Image.new("RGB", (tile_size * 2 + gap, tile_size), "white")
+    if left_tile is not None:
+        combo.paste(left_tile, (0, 0))
+    if right_tile is not None:
+        combo.paste(right_tile, (tile_size + gap, 0))
+    draw = ImageDraw.Draw(combo)
+
+    def draw_border(x, color):
+        draw.rectangle([x + 3, 3, x + tile_size - 4, tile_size - 4], outline=color, width=4)
+
+    if hl_left == "correct":
+        draw_border(0, COLOR_CORRECT)
+    elif hl_left == "wrong":
+        draw_border(0, COLOR_WRONG)
+
+    if hl_right == "correct":
+        draw_border(tile_size + gap, COLOR_CORRECT)
+    elif hl_right == "wrong":
+        draw_border(tile_size + gap, COLOR_WRONG)
+
+    return combo
+
+
+def combo_png(left_path, right_path, tile_size, gap, hl_left=None, hl_right=None):
+    """模式2 左右並排圖（含對錯框線），輸出 PNG；無 PIL 時回傳 None。"""
+    left_tile = make_square_tile(left_path, tile_size)
+    right_tile = make_square_tile(right_path, tile_size)
+    combo = compose_combo(left_tile, right_tile, tile_size, gap, hl_left, hl_right)
+    if combo is None:
+        return None
+    return _to_png(combo)
+
+
+# ================= 快取與批次渲染 =================
+_MISSING = object()
+
+
+class LRUCache:
+    """有上限的 LRU 快取（執行緒安全），超過 max_entries 時淘汰最久未用的項目。"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+
+def _discard_pool(pool, on_pool_broken):
+    pool.shutdown(wait=False, cancel_futures=True)
+    if on_pool_broken is not None:
+        on_pool_broken()
+
+
+def render_batch(tasks, cache, pool=None, on_pool_broken=None):
+    """
+    tasks: [(key, func, args), ...]，func 需為本模組內可 pickle 的函式。
+    只渲染快取未命中的項目（多張且有行程池時平行處理），依 tasks 順序回傳結果。
+    單張渲染失敗回傳 None 且不寫入快取；行程池損壞時先 shutdown 再呼叫
+    on_pool_broken，剩下的圖片改為逐張渲染。
+    """
+    results = {}
+    missing = {}
+    for key, func, args in tasks:
+        if key in results or key in missing:
+            continue
+        value = cache.get(key, _MISSING)
+        if value is _MISSING:
+            missing[key] = (func, args)
+        else:
+            results[key] = value
+
+    failed = set()
+    if pool is not None and len(missing) > 1:
+        try:
+            futures = {key: pool.submit(func, *args) for key, (func, args) in missing.items()}
+        except BrokenProcessPool:
+            futures = {}
+            _discard_pool(pool, on_pool_broken)
+        except RuntimeError:
+            # 已被其他 session 關閉的行程池：本次直接逐張渲染
+            futures = {}
+        for key, fut in futures.items():
+            try:
+                results[key] = fut.result()
+            except BrokenProcessPool:
+                _discard_pool(pool, on_pool_broken)
+                break
+            except Exception:
+                results[key] = None
+                failed.add(key)
+
+    for key, (func, args) in missing.items():
+        if key in results:
+            continue
+        try:
+            results[key] = func(*args)
+        except Exception:
+            results[key] = None
+            failed.add(key)
+
+    for key in missing:
+        if key not in failed:
+            cache.put(key, results[key])
+
+    return [results[key] for key, _, _ in tasks]
@@ -0,0 +1,127 @@
+# test_image_tools.py
+# image_tools 的圖片輸出、LRU 快取與批次渲染測試
+
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+pytest.importorskip("PIL")
+from PIL import Image
+
+import image_tools
+from image_tools import LRUCache, card_png, combo_png, render_batch
+
+PHOTO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "photos")
+PHOTOS = [os.path.join(PHOTO_DIR, f"{i}.jpg") for i in range(1, 7)]
+
+
+def _png_size(data):
+    with Image.open(io.BytesIO(data)) as img:
+        assert img.format == "PNG"
+        return img.size
+
+
+def test_card_png_size():
+    assert _png_size(card_png(PHOTOS[0], 140)) == (140, 140)
+
+
+def test_card_png_missing_path(tmp_path):
+    assert card_png(str(tmp_path / "nope.jpg"), 140) is None
+
+
+def test_combo_png_size():
+    data = combo_png(PHOTOS[0], PHOTOS[1], 200, 8, "correct", "wrong")
+    assert _png_size(data) == (408, 200)
+
+
+def test_combo_png_missing_path_uses_placeholder(tmp_path):
+    data = combo_png(PHOTOS[0], str(tmp_path / "nope.jpg"), 200, 8)
+    assert _png_size(data) == (408, 200)
+
+
+def test_combo_png_without_pil(monkeypatch):
+    monkeypatch.setattr(image_tools, "Image", None)
+    assert combo_png(PHOTOS[0], PHOTOS[1], 200, 8) is None
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+    assert len(cache) == 2
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_render_batch_serial_order_and_duplicates():
+    calls = []
+
+    def fake(name):
+        calls.append(name)
+        return name.upper()
+
+    tasks = [(name, fake, (name,)) for name in ["b", "a", "b", "c"]]
+    assert render_batch(tasks, LRUCache(10), pool=None) == ["B", "A", "B", "C"]
+    assert calls == ["b", "a", "c"]
+
+
+def test_render_batch_uses_cache():
+    calls = []
+
+    def fake(name):
+        calls.append(name)
+        return name
+
+    cache = LRUCache(10)
+    cache.put("a", "cached")
+    assert render_batch([("a", fake, ("a",)), ("b", fake, ("b",))], cache) == ["cached", "b"]
+    assert calls == ["b"]
+    assert cache.get("b") == "b"
+
+
+def test_render_batch_pool_matches_serial():
+    tasks = [(("card", p), card_png, (p, 140)) for p in reversed(PHOTOS)]
+    serial = render_batch(tasks, LRUCache(10), pool=None)
+    with ProcessPoolExecutor(max_workers=2) as pool:
+        parallel = render_batch(tasks, LRUCache(10), pool=pool)
+    assert parallel == serial
+    assert all(data is not None for data in parallel)
+
+
+def test_render_batch_task_error_only_affects_that_image():
+    def fake(name):
+        if name == "bad":
+            raise ValueError(name)
+        return name
+
+    cache = LRUCache(10)
+    tasks = [(name, fake, (name,)) for name in ["a", "bad", "c"]]
+    assert render_batch(tasks, cache) == ["a", None, "c"]
+    assert cache.get("bad", "absent") == "absent"
+
+
+class _BrokenPool:
+    def __init__(self):
+        self.shutdown_calls = []
+
+    def submit(self, func, *args):
+        raise BrokenProcessPool("worker died")
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.shutdown_calls.append((wait, cancel_futures))
+
+
+def test_render_batch_broken_pool_falls_back_to_serial():
+    pool = _BrokenPool()
+    broken = []
+    tasks = [(name, str.upper, (name,)) for name in ["a", "b"]]
+    result = render_batch(tasks, LRUCache(10), pool=pool, on_pool_broken=lambda: broken.append(True))
+    assert result == ["A", "B"]
+    assert pool.shutdown_calls == [(False, True)]
+    assert broken == [True]